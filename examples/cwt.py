@@ -25,8 +25,7 @@ Experimenting with RFC 8392 CBOR Web Tokens
 ...     b'2f2f6c696768742e6578616d706c652e636f6d041a5612aeb0051a5610d9f006'
 ...     b'1a5610d9f007420b7148093101ef6d789200'
 ... )
->>> macd_schema = CWTMACSchema()
->>> macd_claims = macd_schema.loads(macd_cwt)
+>>> macd_claims = tokens.loads(macd_cwt)
 >>> pprint(macd_claims)
 {'alg': {'alg': 4},
  'kid': {'kid': 'Symmetric256'},
@@ -38,11 +37,15 @@ Experimenting with RFC 8392 CBOR Web Tokens
          'nbf': datetime.datetime(2015, 10, 4, 7, 49, 4, tzinfo=datetime.timezone.utc),
          'sub': 'erikw'},
  'tag': '093101ef6d789200'}
+>>> from cbor2 import CBORTag
+>>> encoded = tokens.dumps(CBORTag(61, CBORTag(17, macd_claims)))
+>>> encoded[:3] == macd_cwt[:3]  # Tagged only once with 61 and 17
+True
+>>> tokens.loads(encoded) == macd_claims
+True
 """
 
-import cbor2
-from marshmallow import pre_load, post_dump, ValidationError
-from marshmallow_cbor import Schema, fields
+from marshmallow_cbor import Schema, TagDispatcher, fields
 
 
 class CWTClaimsSchema(Schema):
@@ -69,13 +72,6 @@ class CWTMACSchema(Schema):
     payload = fields.Embedded(fields.Nested(CWTClaimsSchema))  # Protected
     tag = fields.Bytes(load_as='hex')                          # Unprotected
 
-    @pre_load
-    def unpack_tags(self, data, **kwargs):
-        if isinstance(data, cbor2.CBORTag) and data.tag == 61 and data.value.tag == 17:
-            return data.value.value
-        else:
-            raise ValidationError
-
     def _deserialize(self, data, many, **kwargs):
         row = dict(alg=data[0], kid=data[1], payload=data[2], tag=data[3])
         return super()._deserialize(row, many=many, **kwargs)
@@ -85,6 +81,6 @@ class CWTMACSchema(Schema):
         payload = [value['alg'], value['kid'], value['payload'], value['tag']]
         return payload
 
-    @post_dump
-    def pack_tags(self, data, **kwargs):
-        return cbor2.CBORTag(61, cbor2.CBORTag(17, data))
+
+# A CWT (tag 61) is either a COSE_Mac0 (tag 17) structure or just the claims
+tokens = TagDispatcher({(61, 17): CWTMACSchema, 61: CWTClaimsSchema})
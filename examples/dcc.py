@@ -52,15 +52,13 @@ Specification:
 ...     'signature': ('a8d9272ad0789b242812686b68920878447f9ef5114533ee85c821e5575bb2f46cb'
 ...                   '3f5b1dfc4b71bc115054a34b818fb6de97df27b701f267a99f9c468d0a507'),
 ... }
->>> schema = SignedDCCSchema()
->>> expected == schema.loads(decompressed)
+>>> expected == certificates.loads(decompressed)
 True
 
 """
-import cbor2
 from marshmallow import pre_load
 
-from marshmallow_cbor import Schema, fields
+from marshmallow_cbor import Schema, TagDispatcher, fields
 
 
 class PersonalName(Schema):
@@ -116,8 +114,9 @@ class SignedDCCSchema(Schema):
     signature = fields.Bytes(load_as='hex')
 
     def _deserialize(self, data, **kwargs):
-        if isinstance(data, cbor2.CBORTag):
-            if data.tag == 18:
-                data = data.value
         dikt = dict(header=data[0], payload=data[2], signature=data[3])
         return super()._deserialize(dikt, **kwargs)
+
+
+# COSE_Sign1 (tag 18) signed certificates
+certificates = TagDispatcher({18: SignedDCCSchema})
@@ -1,4 +1,4 @@
 from . import fields
-from .schema import Schema
+from .schema import Schema, TagDispatcher
 
-__all__ = ["Schema", "fields"]
+__all__ = ["Schema", "TagDispatcher", "fields"]
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from time import monotonic
+
+_missing = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry when full
+
+    :param maxsize: Maximum number of entries.
+    :param ttl: Optional number of seconds after which an entry expires.
+    """
+
+    def __init__(self, maxsize, *, ttl=None):
+        if maxsize < 1:
+            raise ValueError(f'cache size must be positive, not {maxsize}')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _missing)
+            if item is not _missing:
+                value, expires = item
+                if expires is None or expires > monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __deepcopy__(self, memo):
+        # Copy the entries but not the lock
+        copied = LRUCache(self.maxsize, ttl=self.ttl)
+        with self._lock:
+            copied._data = deepcopy(self._data, memo)
+            copied.hits, copied.misses, copied.evictions = self.hits, self.misses, self.evictions
+        return copied
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,20 @@
+from cbor2 import CBORTag, dumps
+
+
+def canonical_key(key):
+    """Sort key for map keys in RFC 8949 deterministic (bytewise lexicographic)
+    order of their encoding"""
+    return dumps(key)
+
+
+def canonicalize(value):
+    """Copy of ``value`` with the keys of all maps inside it in deterministic order"""
+    if isinstance(value, dict):
+        return {
+            key: canonicalize(value[key]) for key in sorted(value, key=canonical_key)
+        }
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(item) for item in value]
+    if isinstance(value, CBORTag):
+        return CBORTag(value.tag, canonicalize(value.value))
+    return value
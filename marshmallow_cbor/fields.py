@@ -2,10 +2,54 @@ import binascii
 import ipaddress
 import uuid
 from calendar import timegm
+from copy import copy, deepcopy
 from datetime import datetime, timezone
 
 from cbor2 import CBORSimpleValue, CBORTag, dumps, loads
-from marshmallow import fields as m_fields, utils
+from marshmallow import fields as m_fields, missing, utils
+
+from .cache import LRUCache
+from .canonical import canonicalize
+
+_uncached = object()
+
+
+class Cached:
+    """Field mixin adding a ``cache`` option which remembers the loaded (and
+    validated) value for up to ``cache`` distinct input values. Repeated inputs
+    skip parsing and validation and share the same loaded object, so only use it
+    for fields that load immutable values.
+
+    :param cache: Number of distinct values to remember.
+    """
+
+    def __init__(self, *args, cache=None, **kwargs):
+        self._value_cache = LRUCache(cache) if cache else None
+        super().__init__(*args, **kwargs)
+
+    def __deepcopy__(self, memo):
+        # marshmallow copies every field for each schema instance, share the
+        # cache between the copies instead.
+        if self._value_cache is not None:
+            memo[id(self._value_cache)] = self._value_cache
+        result = copy(self)
+        memo[id(self)] = result
+        result.__dict__.update(deepcopy(self.__dict__, memo))
+        return result
+
+    def deserialize(self, value, attr=None, data=None, **kwargs):
+        if self._value_cache is None or value is None or value is missing:
+            return super().deserialize(value, attr, data, **kwargs)
+        # Include the type so 1, 1.0 and True don't share an entry
+        key = (type(value), value)
+        try:
+            result = self._value_cache.get(key, _uncached)
+        except TypeError:  # Unhashable value
+            return super().deserialize(value, attr, data, **kwargs)
+        if result is _uncached:
+            result = super().deserialize(value, attr, data, **kwargs)
+            self._value_cache.set(key, result)
+        return result
 
 
 # Fields for custom tags (not handled natively by cbor2)
@@ -53,16 +97,88 @@ class Embedded(m_fields.Field):
 
     def _serialize(self, nested_obj, attr, obj, **kwargs):
         serialized = self._embedded_field._serialize(nested_obj, attr, obj, **kwargs)
+        if getattr(getattr(self.root, 'opts', None), 'deterministic', False):
+            serialized = canonicalize(serialized)
         return dumps(serialized)
 
     def _deserialize(self, value, attr, data, partial=None, **kwargs):
-        if isinstance(value, bytes):
+        if isinstance(value, (bytes, bytearray, memoryview)):
             value = loads(value)
         return self._embedded_field._deserialize(
             value, attr, data, partial=partial, **kwargs
         )
 
 
+class TagUnion(m_fields.Field):
+    """Choose a schema by the CBOR tag wrapping the value
+
+    Nested tags are matched by using a tuple of tag IDs (outermost first) as the
+    key, e.g. ``{(61, 17): CWTMACSchema}`` for a MAC'd CWT. The longest matching
+    tag path wins and the matched tags are stripped before loading. A ``None`` key
+    selects the schema for untagged values.
+
+    Values are dumped from a ``CBORTag`` whose tag(s) select the schema, so
+    ``CBORTag(18, obj)`` is dumped with the schema registered for tag 18.
+
+    :param schemas: Mapping of tag ID (or tuple of tag IDs) to a schema class,
+        instance or name as accepted by ``fields.Nested``.
+    """
+
+    default_error_messages = {'wrong_tag': 'unexpected tag'}
+
+    def __init__(self, schemas, **kwargs):
+        self._schemas = {}
+        for tags, schema in schemas.items():
+            if tags is not None and not isinstance(tags, tuple):
+                tags = (tags,)
+            self._schemas[tags] = m_fields.Nested(schema)
+        # Every partial tag path that could still lead to a match, so the walk
+        # down a deeply tagged value stops as soon as nothing can match.
+        self._prefixes = {
+            tags[:i] for tags in self._schemas if tags for i in range(1, len(tags) + 1)
+        }
+        super().__init__(**kwargs)
+
+    def _bind_to_schema(self, field_name, schema):
+        super()._bind_to_schema(field_name, schema)
+        for nested in self._schemas.values():
+            nested._bind_to_schema(field_name, self)
+
+    def _lookup(self, value):
+        """Return the tag path, nested field and untagged value for ``value``"""
+        match = (None, None, value)
+        if not isinstance(value, CBORTag):
+            match = (None, self._schemas.get(None), value)
+        tags = ()
+        while isinstance(value, CBORTag):
+            tags += (value.tag,)
+            if tags not in self._prefixes:
+                break
+            value = value.value
+            if tags in self._schemas:
+                match = (tags, self._schemas[tags], value)
+        if match[1] is None:
+            raise self.make_error('wrong_tag', input=value)
+        return match
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+        tags, nested, value = self._lookup(value)
+        serialized = nested.schema.dump(value)
+        if tags:
+            # Schemas with a Meta.tag already wrap their own output
+            if tags[-1] == nested.schema.opts.tag:
+                tags = tags[:-1]
+            for tag in reversed(tags):
+                serialized = CBORTag(tag, serialized)
+        return serialized
+
+    def _deserialize(self, value, attr, data, partial=None, **kwargs):
+        tags, nested, value = self._lookup(value)
+        return nested._deserialize(value, attr, data, partial=partial, **kwargs)
+
+
 # Native CBOR fields that can just be passed through
 
 
@@ -71,17 +187,22 @@ class Bytes(m_fields.Field):
     we can chose to load them as strings. If you don't want to interpret
     bytes objects just use ``fields.Raw()`` instead.
 
+    Any bytes-like object (``bytes``, ``bytearray`` or ``memoryview``) can be
+    dumped. Loading with ``load_as=None`` returns the ``bytes`` object decoded by
+    cbor2 without copying it again; cbor2 always copies byte strings out of the
+    input, so views onto the original input buffer are not possible.
+
     :param load_as: String representation of bytes object
     """
 
     LOAD_AS = {
         None: lambda x: x,
-        'hex': lambda x: binascii.hexlify(x).decode(),
-        'utf8': lambda x: x.decode('utf-8', errors='backslashreplace'),
+        'hex': lambda x: x.hex(),
+        'utf8': lambda x: str(x, 'utf-8', errors='backslashreplace'),
     }
     DUMP_AS = {
         None: lambda x: x,
-        'hex': lambda x: binascii.unhexlify(x),
+        'hex': lambda x: bytes.fromhex(x) if isinstance(x, str) else binascii.unhexlify(x),
         'utf8': lambda x: x.encode('utf-8'),
     }
 
@@ -91,16 +212,21 @@ class Bytes(m_fields.Field):
             self._dump_func = self.DUMP_AS[load_as]
         except KeyError:
             raise ValueError(f'unsupported bytes representation {load_as}')
+        self.load_as = load_as
         super().__init__(**kwargs)
 
     def _serialize(self, value, attr, obj, **kwargs):
-        return self._dump_func(value)
+        value = self._dump_func(value)
+        # cbor2 can encode bytearray directly but not memoryview
+        if isinstance(value, memoryview):
+            return value.tobytes()
+        return value
 
     def _deserialize(self, value, attr, data, **kwargs):
         return self._load_func(value)
 
 
-class Timestamp(m_fields.AwareDateTime):
+class Timestamp(Cached, m_fields.AwareDateTime):
     """Unix epoch seconds in UTC.
 
     If you want it to be on the wire as an CBOR Tagged timestamp use
@@ -122,7 +248,7 @@ class Timestamp(m_fields.AwareDateTime):
             return datetime.fromtimestamp(value, tz=timezone.utc)
 
 
-class AwareDateTime(m_fields.AwareDateTime):
+class AwareDateTime(Cached, m_fields.AwareDateTime):
     """
     Passes timezone aware fields directly to cbor encoder to be written as ISO
     tagged timestamp strings.
@@ -137,7 +263,7 @@ class AwareDateTime(m_fields.AwareDateTime):
             return super()._deserialize(value, attr, data, **kwargs)
 
 
-class UUID(m_fields.UUID):
+class UUID(Cached, m_fields.UUID):
     """
     Passes UUID fields directly to cbor encoder to be written as tagged UUID in
     bytes form.
@@ -239,7 +365,7 @@ class SimpleValue(m_fields.Field):
             raise self.make_error("simple")
 
 
-# Unchanged fields from marshmallow
+# Fields from marshmallow, with the cache option added to those parsing strings
 
 Field = m_fields.Field
 Raw = m_fields.Raw
@@ -248,22 +374,22 @@ Mapping = m_fields.Mapping
 Dict = m_fields.Dict
 List = m_fields.List
 Tuple = m_fields.Tuple
-String = m_fields.String
+String = type('String', (Cached, m_fields.String), {})
 Number = m_fields.Number
 Integer = m_fields.Integer
 Decimal = m_fields.Decimal
 Boolean = m_fields.Boolean
 Float = m_fields.Float
-Time = m_fields.Time
-Date = m_fields.Date
-DateTime = m_fields.DateTime
+Time = type('Time', (Cached, m_fields.Time), {})
+Date = type('Date', (Cached, m_fields.Date), {})
+DateTime = type('DateTime', (Cached, m_fields.DateTime), {})
 TimeDelta = m_fields.TimeDelta
-Url = m_fields.Url
-URL = m_fields.URL
-Email = m_fields.Email
+Url = type('Url', (Cached, m_fields.Url), {})
+URL = Url
+Email = type('Email', (Cached, m_fields.Email), {})
 Method = m_fields.Method
 Function = m_fields.Function
-Str = m_fields.Str
+Str = String
 Bool = m_fields.Bool
 Int = m_fields.Int
 Constant = m_fields.Constant
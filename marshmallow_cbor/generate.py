@@ -0,0 +1,265 @@
+"""
+Generate random but valid objects for a schema, e.g. for load testing::
+
+    generator = Generator(CWTClaimsSchema, seed=1)
+    with open('claims.cborseq', 'wb') as fp:
+        generator.write_sequence(fp, 1000000)
+"""
+import ipaddress
+import math
+import random
+import string
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from cbor2 import CBORSimpleValue, CBORTag
+from marshmallow import fields as m_fields, missing, validate
+
+from . import fields
+
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+SPAN = 40 * 365 * 24 * 3600  # Roughly 2000 to 2040 in seconds
+# 20 to 31 are reserved for false, true, null, undefined etc.
+SIMPLE_VALUES = (*range(20), *range(32, 256))
+
+
+class Generator:
+    """Random objects for a schema, in the form expected by ``schema.dump``
+
+    Values honour ``OneOf``, ``Range`` and ``Length`` validators. Fields are
+    visited in name order, so the same seed always produces the same objects.
+    The encoded bytes are only identical between processes if the schema's map
+    key order is fixed too, with ``Meta.ordered`` or ``Meta.deterministic``.
+
+    :param schema: Schema class or instance.
+    :param seed: Seed for the random number generator.
+    :param max_items: Largest number of items in generated lists and mappings.
+    :param max_depth: How deep to follow (possibly recursive) nested schemas.
+    """
+
+    def __init__(self, schema, *, seed=None, max_items=5, max_depth=5):
+        self.schema = schema() if isinstance(schema, type) else schema
+        self.random = random.Random(seed)
+        self.max_items = max_items
+        self.max_depth = max_depth
+
+    def object(self):
+        return self._schema_object(self.schema, 0)
+
+    def objects(self, count):
+        for _ in range(count):
+            yield self.object()
+
+    def encoded(self, count, **kwargs):
+        """Yield ``count`` objects encoded with ``schema.dumps``"""
+        for obj in self.objects(count):
+            yield self.schema.dumps(obj, **kwargs)
+
+    def write_sequence(self, fp, count, **kwargs):
+        """Write ``count`` encoded objects to ``fp`` as a CBOR sequence (RFC 8742)"""
+        for encoded in self.encoded(count, **kwargs):
+            fp.write(encoded)
+
+    def _schema_object(self, schema, depth):
+        obj = {}
+        for name in sorted(schema.dump_fields):
+            field = schema.dump_fields[name]
+            value = self.value(field, depth)
+            if value is not missing:
+                obj[field.attribute or name] = value
+        return obj
+
+    def value(self, field, depth=0):
+        """Random value for ``field``, or ``missing`` for computed fields"""
+        for validator in field.validators:
+            if isinstance(validator, validate.OneOf):
+                return self.random.choice(list(validator.choices))
+        for cls in type(field).__mro__:
+            if cls in GENERATORS:
+                return GENERATORS[cls](self, field, depth)
+        return missing
+
+    def _range(self, field, low, high):
+        """Bounds from ``Range`` validators as ``(low, high, low_inclusive,
+        high_inclusive)``"""
+        low_inclusive = high_inclusive = True
+        for validator in field.validators:
+            if isinstance(validator, validate.Range):
+                if validator.min is not None:
+                    low = validator.min
+                    low_inclusive = getattr(validator, 'min_inclusive', True)
+                if validator.max is not None:
+                    high = validator.max
+                    high_inclusive = getattr(validator, 'max_inclusive', True)
+        return low, high, low_inclusive, high_inclusive
+
+    def _length_range(self, field, low=1, high=16):
+        for validator in field.validators:
+            if isinstance(validator, validate.Length):
+                if validator.equal is not None:
+                    return validator.equal, validator.equal
+                if validator.min is not None:
+                    low = validator.min
+                    high = max(low, high)
+                if validator.max is not None:
+                    high = validator.max
+                    low = min(low, high)
+        return low, high
+
+    def _length(self, field, low=1, high=16):
+        return self.random.randint(*self._length_range(field, low, high))
+
+    def _word(self, length=None):
+        if length is None:
+            length = self.random.randint(3, 10)
+        return ''.join(self.random.choices(string.ascii_lowercase, k=length))
+
+    def _bytes(self, length):
+        return self.random.getrandbits(8 * length).to_bytes(length, 'big') if length else b''
+
+    def _datetime(self):
+        return EPOCH + timedelta(seconds=self.random.randrange(SPAN))
+
+
+def _nested(gen, field, depth):
+    if depth >= gen.max_depth:
+        return [] if field.many else missing
+    if field.many:
+        return [
+            gen._schema_object(field.schema, depth + 1)
+            for _ in range(gen.random.randint(0, gen.max_items))
+        ]
+    return gen._schema_object(field.schema, depth + 1)
+
+
+def _tag_union(gen, field, depth):
+    tags, nested = gen.random.choice(list(field._schemas.items()))
+    value = _nested(gen, nested, depth)
+    for tag in reversed(tags or ()):
+        value = CBORTag(tag, value)
+    return value
+
+
+def _bytes(gen, field, depth):
+    # Length validators apply to the loaded form, i.e. the hex or text string
+    if field.load_as == 'hex':
+        low, high = gen._length_range(field, 2, 32)
+        # Hex strings always have an even length
+        low, high = (low + 1) // 2, high // 2
+        if low > high:
+            raise ValueError(f'no hex string of even length fits the Length of {field.name!r}')
+        return gen._bytes(gen.random.randint(low, high)).hex()
+    length = gen._length(field)
+    if field.load_as == 'utf8':
+        return gen._word(length)
+    return gen._bytes(length)
+
+
+def _integer_range(low, high, low_inclusive, high_inclusive):
+    if not low_inclusive and low == math.floor(low):
+        low += 1
+    if not high_inclusive and high == math.ceil(high):
+        high -= 1
+    return math.ceil(low), math.floor(high)
+
+
+def _integer(gen, field, depth):
+    low, high, low_inclusive, high_inclusive = gen._range(field, -(2 ** 31), 2 ** 31 - 1)
+    return gen.random.randint(*_integer_range(low, high, low_inclusive, high_inclusive))
+
+
+def _float(gen, field, depth):
+    low, high, low_inclusive, high_inclusive = gen._range(field, -1e6, 1e6)
+    while True:
+        value = gen.random.uniform(low, high)
+        if (low_inclusive or value != low) and (high_inclusive or value != high):
+            return value
+
+
+def _decimal(gen, field, depth):
+    # Whole cents between the bounds
+    low, high, low_inclusive, high_inclusive = gen._range(field, -10 ** 6, 10 ** 6)
+    cents = _integer_range(
+        Decimal(str(low)) * 100, Decimal(str(high)) * 100, low_inclusive, high_inclusive
+    )
+    return Decimal(gen.random.randint(*cents)) / 100
+
+
+def _ip_network(gen, field, depth):
+    cls = field.DESERIALIZATION_CLASS or ipaddress.IPv4Network
+    bits = ipaddress.IPV4LENGTH if cls is ipaddress.IPv4Network else ipaddress.IPV6LENGTH
+    address = gen.random.getrandbits(bits)
+    prefix = gen.random.randint(8, bits)
+    return cls((address, prefix), strict=False)
+
+
+def _url(gen, field, depth):
+    schemes = ['https']
+    for validator in field.validators:
+        if isinstance(validator, validate.URL) and validator.schemes:
+            schemes = sorted(validator.schemes)
+    return f'{gen.random.choice(schemes)}://{gen._word()}.example.com/{gen._word()}'
+
+
+def _simple_value(gen, field, depth):
+    return CBORSimpleValue(gen.random.choice(SIMPLE_VALUES))
+
+
+def _mapping(gen, field, depth):
+    return {
+        gen.value(field.key_field, depth) if field.key_field else gen._word():
+        gen.value(field.value_field, depth) if field.value_field else gen._word()
+        for _ in range(gen.random.randint(0, gen.max_items))
+    }
+
+
+GENERATORS = {
+    fields.Tagged: lambda gen, field, depth: gen.value(field._tagged_field, depth),
+    fields.Embedded: lambda gen, field, depth: gen.value(field._embedded_field, depth),
+    fields.TagUnion: _tag_union,
+    fields.Bytes: _bytes,
+    fields.SimpleValue: _simple_value,
+    fields.IPNetwork: _ip_network,
+    m_fields.Nested: _nested,
+    m_fields.Method: lambda gen, field, depth: missing,
+    m_fields.Function: lambda gen, field, depth: missing,
+    m_fields.Constant: lambda gen, field, depth: field.constant,
+    m_fields.List: lambda gen, field, depth: [
+        gen.value(field.inner, depth) for _ in range(gen._length(field, 0, gen.max_items))
+    ],
+    m_fields.Tuple: lambda gen, field, depth: tuple(
+        gen.value(inner, depth) for inner in field.tuple_fields
+    ),
+    m_fields.Mapping: _mapping,
+    m_fields.Email: lambda gen, field, depth: f'{gen._word()}@example.com',
+    m_fields.Url: _url,
+    m_fields.UUID: lambda gen, field, depth: uuid.UUID(
+        int=gen.random.getrandbits(128), version=4
+    ),
+    m_fields.String: lambda gen, field, depth: gen._word(gen._length(field)),
+    m_fields.Boolean: lambda gen, field, depth: gen.random.random() < 0.5,
+    m_fields.Integer: _integer,
+    m_fields.Float: _float,
+    m_fields.Decimal: _decimal,
+    m_fields.Number: _integer,
+    m_fields.NaiveDateTime: lambda gen, field, depth: gen._datetime().replace(tzinfo=None),
+    m_fields.DateTime: lambda gen, field, depth: gen._datetime(),
+    m_fields.Date: lambda gen, field, depth: gen._datetime().date(),
+    m_fields.Time: lambda gen, field, depth: gen._datetime().time(),
+    m_fields.TimeDelta: lambda gen, field, depth: timedelta(
+        seconds=gen.random.randrange(SPAN)
+    ),
+    m_fields.IP: lambda gen, field, depth: ipaddress.IPv4Address(gen.random.getrandbits(32)),
+    m_fields.IPv4: lambda gen, field, depth: ipaddress.IPv4Address(gen.random.getrandbits(32)),
+    m_fields.IPv6: lambda gen, field, depth: ipaddress.IPv6Address(
+        gen.random.getrandbits(128)
+    ),
+    m_fields.IPv4Interface: lambda gen, field, depth: ipaddress.IPv4Interface(
+        (gen.random.getrandbits(32), gen.random.randint(8, 32))
+    ),
+    m_fields.IPv6Interface: lambda gen, field, depth: ipaddress.IPv6Interface(
+        (gen.random.getrandbits(128), gen.random.randint(8, 128))
+    ),
+    m_fields.Raw: lambda gen, field, depth: gen._bytes(gen._length(field)),
+}
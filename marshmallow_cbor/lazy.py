@@ -0,0 +1,117 @@
+from collections.abc import Mapping
+
+from marshmallow import INCLUDE, RAISE, missing
+from marshmallow.decorators import VALIDATES_SCHEMA
+from marshmallow.error_store import ErrorStore
+from marshmallow.validate import ValidationError
+
+
+class LazyRecord(Mapping):
+    """Read only mapping over a decoded CBOR map that only deserializes (and
+    validates) each field the first time it is accessed.
+
+    Keys are the same as in the result of ``Schema.load``. Whether a key is in the
+    record only depends on the keys of the CBOR map and the fields' defaults, so
+    ``in`` never deserializes anything. Reading an invalid field (including with
+    ``get()``) raises ``ValidationError``.
+
+    Unknown keys, ``@validates`` and ``@validates_schema`` are only checked by
+    ``validate_all()``. ``pre_load`` and ``post_load`` hooks are not run.
+
+    :param schema: Schema instance providing the fields.
+    :param data: Decoded CBOR map.
+    """
+
+    def __init__(self, schema, data):
+        self._schema = schema
+        self._data = data
+        self._loaded = {}
+        self._fields = {}
+        for name, field in schema.load_fields.items():
+            data_key = name if field.data_key is None else field.data_key
+            self._fields[field.attribute or name] = (name, field, data_key)
+        self._data_keys = {data_key for name, field, data_key in self._fields.values()}
+        self._unknown = {}
+        if schema.unknown == INCLUDE:
+            self._unknown = {
+                key: value for key, value in data.items() if key not in self._data_keys
+            }
+
+    def __getitem__(self, key):
+        try:
+            return self._loaded[key]
+        except KeyError:
+            pass
+        if key in self._unknown:
+            return self._unknown[key]
+        name, field, data_key = self._fields[key]
+        try:
+            value = field.deserialize(self._data.get(data_key, missing), name, self._data)
+        except ValidationError as error:
+            raise ValidationError({data_key: error.messages}) from error
+        if value is missing:
+            raise KeyError(key)
+        self._loaded[key] = value
+        return value
+
+    def __contains__(self, key):
+        if key in self._unknown:
+            return True
+        try:
+            name, field, data_key = self._fields[key]
+        except (KeyError, TypeError):
+            return False
+        return data_key in self._data or field.missing is not missing
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        for key in self._fields:
+            if key in self:
+                yield key
+        yield from self._unknown
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} of {self._schema.__class__.__name__}>'
+
+    def validate_all(self):
+        """Deserialize every remaining field and run the same validation as
+        ``Schema.load``: missing required fields, unknown keys per the schema's
+        ``unknown`` option, ``@validates`` and ``@validates_schema`` methods.
+
+        :raises ValidationError: With the messages for everything that is invalid.
+        """
+        schema = self._schema
+        error_store = ErrorStore()
+        result = {}
+        for key in self._fields:
+            try:
+                result[key] = self[key]
+            except KeyError:
+                pass
+            except ValidationError as error:
+                error_store.store_error(error.messages)
+        result.update(self._unknown)
+        if schema.unknown == RAISE:
+            for key in self._data.keys() - self._data_keys:
+                error_store.store_error([schema.error_messages['unknown']], key)
+        schema._invoke_field_validators(error_store=error_store, data=result, many=False)
+        if schema._has_processors(VALIDATES_SCHEMA):
+            field_errors = bool(error_store.errors)
+            for pass_many in (True, False):
+                schema._invoke_schema_validators(
+                    error_store=error_store,
+                    pass_many=pass_many,
+                    data=result,
+                    original_data=self._data,
+                    many=False,
+                    partial=schema.partial,
+                    field_errors=field_errors,
+                )
+        if error_store.errors:
+            raise ValidationError(error_store.errors, data=self._data, valid_data=result)
+        return self
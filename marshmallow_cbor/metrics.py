@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from collections import Counter
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets
+
+    :param bounds: Sorted upper bounds (inclusive) of each bucket, values larger
+        than the last bound are counted in an extra overflow bucket.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def snapshot(self):
+        return {
+            'bounds': self.bounds,
+            'counts': list(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class SchemaMetrics:
+    """Counters and histograms for the load and dump calls of one schema class
+
+    Enable it with ``metrics = True`` on the schema's ``Meta`` class and read it
+    from ``MySchema.opts.metrics``. Updates are plain attribute increments with no
+    locking, so counts from many threads at once are approximate.
+    """
+
+    LATENCY_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+    BATCH_BUCKETS = (1, 10, 100, 1000, 10000)
+    SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+    def __init__(self):
+        self.load_latency = Histogram(self.LATENCY_BUCKETS)
+        self.dump_latency = Histogram(self.LATENCY_BUCKETS)
+        self.batch_size = Histogram(self.BATCH_BUCKETS)
+        self.encoded_size = Histogram(self.SIZE_BUCKETS)
+        self.reset()
+
+    def reset(self):
+        self.loads = 0
+        self.dumps = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+        self.field_errors = Counter()
+        self.load_latency.reset()
+        self.dump_latency.reset()
+        self.batch_size.reset()
+        self.encoded_size.reset()
+
+    def record_load(self, seconds, records, many):
+        self.loads += 1
+        self.records_in += records
+        self.load_latency.observe(seconds)
+        if many:
+            self.batch_size.observe(records)
+
+    def record_dump(self, seconds, records, many):
+        self.dumps += 1
+        self.records_out += records
+        self.dump_latency.observe(seconds)
+        if many:
+            self.batch_size.observe(records)
+
+    def record_input(self, size):
+        self.bytes_in += size
+
+    def record_output(self, size):
+        self.bytes_out += size
+        self.encoded_size.observe(size)
+
+    def record_error(self, messages, many):
+        """Count a ``ValidationError`` against each field named in its messages"""
+        self.errors += 1
+        if not isinstance(messages, dict):
+            self.field_errors['_schema'] += 1
+            return
+        for key, value in messages.items():
+            # With many=True errors are keyed by the index of the record first
+            if many and isinstance(key, int) and isinstance(value, dict):
+                self.field_errors.update(value.keys())
+            else:
+                self.field_errors[key] += 1
+
+    def snapshot(self):
+        return {
+            'loads': self.loads,
+            'dumps': self.dumps,
+            'records_in': self.records_in,
+            'records_out': self.records_out,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'errors': self.errors,
+            'field_errors': dict(self.field_errors),
+            'load_latency': self.load_latency.snapshot(),
+            'dump_latency': self.dump_latency.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+            'encoded_size': self.encoded_size.snapshot(),
+        }
@@ -1,28 +1,433 @@
+from collections.abc import Mapping
+from copy import deepcopy
+from time import perf_counter
+
 import cbor2
-from marshmallow import Schema as mSchema, SchemaOpts
+from marshmallow import Schema as mSchema, SchemaOpts, fields as m_fields, missing
+from marshmallow.decorators import POST_DUMP, POST_LOAD, PRE_DUMP, PRE_LOAD
+from marshmallow.schema import SchemaMeta
 from marshmallow.validate import ValidationError
 
+from . import fields
+from .cache import LRUCache
+from .canonical import canonical_key, canonicalize
+from .lazy import LazyRecord
+from .metrics import SchemaMetrics
+from .tracking import (
+    TrackedList,
+    TrackedRecord,
+    array_items,
+    byte_string,
+    encode_head,
+    equivalent,
+    map_entries,
+    view,
+)
+
 
 class CBOROptions(SchemaOpts):
     def __init__(self, meta, **kwargs):
         SchemaOpts.__init__(self, meta, **kwargs)
         self.tag = getattr(meta, "tag", None)
         self.render_module = cbor2
+        self.metrics = SchemaMetrics() if getattr(meta, "metrics", False) else None
+        self.load_cache = getattr(meta, "load_cache", None)
+        self.load_cache_ttl = getattr(meta, "load_cache_ttl", None)
+        # Shared by every instance of the schema class, like the metrics
+        self.loads_cache = None
+        if self.load_cache:
+            self.loads_cache = LRUCache(self.load_cache, ttl=self.load_cache_ttl)
+        self.deterministic = getattr(meta, "deterministic", False)
+        self.track_changes = getattr(meta, "track_changes", False)
+
+
+# Fields which never contain maps, so need no sorting in deterministic mode.
+# Embedded sorts its content itself before encoding it.
+_SCALAR_FIELDS = (
+    m_fields.String,
+    m_fields.Number,
+    m_fields.Boolean,
+    m_fields.DateTime,
+    m_fields.Date,
+    m_fields.Time,
+    m_fields.TimeDelta,
+    m_fields.IP,
+    m_fields.IPInterface,
+    fields.IPNetwork,
+    fields.Bytes,
+    fields.SimpleValue,
+    fields.Embedded,
+)
+
+
+class CBORSchemaMeta(SchemaMeta):
+    def __new__(mcs, name, bases, attrs):
+        klass = super().__new__(mcs, name, bases, attrs)
+        # Encode every declared data_key once so dumps doesn't have to sort
+        klass._canonical_keys = {}
+        if klass.opts.deterministic:
+            klass._canonical_keys = {
+                name: canonical_key(name if field.data_key is None else field.data_key)
+                for name, field in klass._declared_fields.items()
+            }
+        return klass
 
 
-class Schema(mSchema):
+class Schema(mSchema, metaclass=CBORSchemaMeta):
+    """marshmallow ``Schema`` which reads and writes CBOR
+
+    Extra ``Meta`` options:
+
+    - ``tag``: Wrap the serialized data in a CBOR tag with this ID.
+    - ``metrics``: Collect ``SchemaMetrics`` in ``opts.metrics`` when ``True``.
+    - ``load_cache``: Cache this many ``loads`` results per schema class, shared
+      by all its instances. Loads while ``context`` is set are not cached.
+    - ``load_cache_ttl``: Seconds before a cached ``loads`` result expires.
+    - ``deterministic``: Dump map keys in RFC 8949 deterministic order. The
+      schema's own keys are ordered once per class, maps inside other fields
+      (``Dict``, ``List``, ``Tagged``, ``Raw``, non-deterministic ``Nested``
+      schemas etc.) are sorted on every dump. Floats are written as cbor2
+      encodes them by default, not in their shortest form, so schemas with
+      float fields don't meet RFC 8949's core deterministic requirements.
+    - ``track_changes``: ``loads`` returns a ``TrackedRecord`` and ``dumps`` of
+      that record only re-encodes what was changed, down to single fields of
+      nested records. Encodings are only reused when they are what the field
+      would dump, and only by ``dumps`` without encoder options. ``Dict``,
+      ``List`` and similar fields are always re-encoded, and so is everything
+      when ``deterministic`` is also set.
+    """
+
     OPTIONS_CLASS = CBOROptions
 
-    def _deserialize(self, data, many, **kwargs):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.load_cache = self.opts.loads_cache
+
+    def load(self, data, *, many=None, partial=None, unknown=None):
+        metrics = self.opts.metrics
+        if metrics is None:
+            return super().load(data, many=many, partial=partial, unknown=unknown)
+        many = self.many if many is None else bool(many)
+        start = perf_counter()
+        try:
+            return super().load(data, many=many, partial=partial, unknown=unknown)
+        except ValidationError as error:
+            metrics.record_error(error.messages, many)
+            raise
+        finally:
+            records = len(data) if many and hasattr(data, '__len__') else 1
+            metrics.record_load(perf_counter() - start, records, many)
+
+    def loads(self, json_data, *, many=None, partial=None, unknown=None, **kwargs):
+        if self.opts.metrics is not None:
+            self.opts.metrics.record_input(len(json_data))
+        if self.load_cache is None or kwargs:
+            result = super().loads(
+                json_data, many=many, partial=partial, unknown=unknown, **kwargs
+            )
+        else:
+            result = self._loads_cached(
+                json_data, many=many, partial=partial, unknown=unknown
+            )
+        if self.opts.track_changes and not (self.many if many is None else many):
+            result = self._track(view(json_data), result)
+        return result
+
+    def _loads_cached(self, json_data, **kwargs):
+        """Load through the LRU cache enabled by ``Meta.load_cache``
+
+        Results are copied on the way in and out of the cache, so callers are free
+        to modify them. The key is the input and the options which change the
+        loaded fields, so loads while the schema has a ``context`` (which
+        validators may use) skip the cache.
+        """
+        if self.context:
+            return super().loads(json_data, **kwargs)
+        key = (
+            json_data,
+            self.many if kwargs['many'] is None else bool(kwargs['many']),
+            self.partial if kwargs['partial'] is None else kwargs['partial'],
+            self.unknown if kwargs['unknown'] is None else kwargs['unknown'],
+            None if self.only is None else frozenset(self.only),
+            frozenset(self.exclude),
+            frozenset(self.dump_only),
+        )
+        start = perf_counter()
+        try:
+            result = self.load_cache.get(key)
+        except TypeError:  # Unhashable input (bytearray) or partial (list)
+            return super().loads(json_data, **kwargs)
+        if result is None:
+            loaded = super().loads(json_data, **kwargs)
+            self.load_cache.set(key, (deepcopy(loaded),))
+            return loaded
+        loaded = deepcopy(result[0])
+        if self.opts.metrics is not None:
+            many = self.many if kwargs['many'] is None else bool(kwargs['many'])
+            records = len(loaded) if many else 1
+            self.opts.metrics.record_load(perf_counter() - start, records, many)
+        return loaded
+
+    def dump(self, obj, *, many=None):
+        metrics = self.opts.metrics
+        if metrics is None:
+            return super().dump(obj, many=many)
+        many = self.many if many is None else bool(many)
+        start = perf_counter()
+        try:
+            return super().dump(obj, many=many)
+        finally:
+            records = len(obj) if many and hasattr(obj, '__len__') else 1
+            metrics.record_dump(perf_counter() - start, records, many)
+
+    def dumps(self, obj, *args, many=None, **kwargs):
+        if (
+            isinstance(obj, TrackedRecord)
+            and obj.schema_class is type(self)
+            and not (self.many if many is None else many)
+            and not args
+            and not kwargs
+            and self._can_splice()
+        ):
+            start = perf_counter()
+            encoded = bytes(self._dumps_tracked(obj))
+            if self.opts.metrics is not None:
+                self.opts.metrics.record_dump(perf_counter() - start, 1, False)
+        else:
+            encoded = super().dumps(obj, *args, many=many, **kwargs)
+        if self.opts.metrics is not None:
+            self.opts.metrics.record_output(len(encoded))
+        return encoded
+
+    def _can_splice(self):
+        """Whether the encoded map is exactly the encoded fields, with no hooks or
+        custom (de)serialization changing its shape. Deterministic schemas always
+        re-encode, the input may not be in canonical form."""
+        cls = type(self)
+        return (
+            not self.opts.deterministic
+            and cls._serialize is Schema._serialize
+            and cls._deserialize is Schema._deserialize
+            and not any(
+                self._has_processors(tag)
+                for tag in (PRE_LOAD, POST_LOAD, PRE_DUMP, POST_DUMP)
+            )
+        )
+
+    def _track(self, data, result):
+        """Return ``result`` loaded from ``data`` as a ``TrackedRecord``, or as it
+        is if its encoding can't be reused"""
+        if not isinstance(result, dict) or not self._can_splice():
+            return result
+        split = map_entries(data)
+        if split is None:
+            return result
+        tags, entries = split
+        items = {key: (entry, value) for key, entry, value in entries}
+        tracked, encoded = {}, {}
+        # The whole encoding can be reused if it is exactly the encoded fields
+        complete = tags == ((self.opts.tag,) if self.opts.tag else ())
+        keys = []
+        for name, field in self.dump_fields.items():
+            attr = field.attribute or name
+            data_key = name if field.data_key is None else field.data_key
+            if attr not in result or name not in self.load_fields or data_key not in items:
+                if field.serialize(name, result, accessor=self.get_attribute) is not missing:
+                    complete = False
+                continue
+            entry, value_encoded = items[data_key]
+            key_encoded = entry[:len(entry) - len(value_encoded)]
+            value = self._track_field(name, field, value_encoded, result)
+            if value is missing or not equivalent(key_encoded, data_key):
+                complete = False
+                continue
+            if isinstance(value, (TrackedRecord, TrackedList)):
+                tracked[attr] = value
+                complete = complete and value.intact()
+            encoded[name] = entry
+            keys.append(data_key)
+        if not (complete and keys == [key for key, entry, value in entries]):
+            data = None
+        return TrackedRecord(
+            {**result, **tracked}, schema_class=type(self), encoded=encoded, source=data
+        )
+
+    def _track_field(self, name, field, encoded, result):
+        """Loaded value of ``field`` to keep in a ``TrackedRecord``, or ``missing``
+        if ``encoded`` isn't what dumping the value would produce"""
+        value = result[field.attribute or name]
+        nested = field._embedded_field if isinstance(field, fields.Embedded) else field
+        if (
+            isinstance(value, (dict, list))
+            and type(nested) is m_fields.Nested
+            and isinstance(nested.schema, Schema)
+        ):
+            if nested is not field:
+                split = byte_string(encoded)
+                if split is None or split[0]:
+                    return missing
+                encoded = split[1]
+            if nested.many:
+                return self._track_items(nested.schema, encoded, value)
+            value = nested.schema._track(encoded, value)
+            return value if isinstance(value, TrackedRecord) else missing
+        # Other values can only be reused if they can't change in place
+        if not isinstance(field, _SCALAR_FIELDS) or isinstance(field, fields.Embedded):
+            return missing
+        try:
+            hash(value)
+        except TypeError:
+            return missing
+        if not equivalent(encoded, field.serialize(name, result, accessor=self.get_attribute)):
+            return missing
+        return value
+
+    @staticmethod
+    def _track_items(schema, encoded, value):
+        split = array_items(encoded)
+        if split is None or split[0] or len(split[1]) != len(value):
+            return missing
+        items = [schema._track(item_encoded, item) for item_encoded, item in zip(split[1], value)]
+        if not all(isinstance(item, TrackedRecord) and item.intact() for item in items):
+            encoded = None
+        return TrackedList(items, source=encoded)
+
+    def _dumps_tracked(self, obj):
+        """Encode ``obj`` reusing the original encoding of unchanged fields and
+        nested records"""
+        if obj.intact():
+            return obj.source
+        items = []
+        for name, field in self.dump_fields.items():
+            attr = field.attribute or name
+            data_key = name if field.data_key is None else field.data_key
+            if name in obj.encoded and attr not in obj.changed:
+                value = obj[attr]
+                if not isinstance(value, (TrackedRecord, TrackedList)) or value.intact():
+                    items.append(obj.encoded[name])
+                else:
+                    items.append(cbor2.dumps(data_key) + self._dumps_tracked_value(field, value))
+                continue
+            value = field.serialize(name, obj, accessor=self.get_attribute)
+            if value is missing:
+                continue
+            items.append(cbor2.dumps(data_key) + cbor2.dumps(value))
+        encoded = encode_head(5, len(items)) + b''.join(items)
+        if self.opts.tag:
+            encoded = encode_head(6, self.opts.tag) + encoded
+        return encoded
+
+    @staticmethod
+    def _dumps_tracked_value(field, value):
+        """Encode the changed nested record(s) ``value`` of ``field``"""
+        nested = field._embedded_field if isinstance(field, fields.Embedded) else field
+        schema = nested.schema
+        if isinstance(value, TrackedList):
+            encoded = encode_head(4, len(value)) + b''.join(
+                schema._dumps_tracked(item)
+                if isinstance(item, TrackedRecord) and item.schema_class is type(schema)
+                else cbor2.dumps(schema.dump(item, many=False))
+                for item in value
+            )
+        else:
+            encoded = schema._dumps_tracked(value)
+        if nested is not field:
+            encoded = encode_head(2, len(encoded)) + encoded
+        return encoded
+
+    def load_lazy(self, data):
+        """Return a ``LazyRecord`` which deserializes fields of ``data`` on access
+
+        Call ``validate_all()`` on the result to check every field up front.
+        """
+        data = self._untag(data)
+        if not isinstance(data, Mapping):
+            raise ValidationError({'_schema': [self.error_messages['type']]})
+        return LazyRecord(self, data)
+
+    def loads_lazy(self, data, **kwargs):
+        return self.load_lazy(cbor2.loads(data, **kwargs))
+
+    def _untag(self, data):
         if isinstance(data, cbor2.CBORTag):
             if data.tag == self.opts.tag:
-                data = data.value
+                return data.value
             else:
                 raise ValidationError(f'unexpected tag: {data.tag}')
+        return data
+
+    def _deserialize(self, data, many, **kwargs):
+        data = self._untag(data)
         return super()._deserialize(data, many=many, **kwargs)
 
+    def _init_fields(self):
+        super()._init_fields()
+        if self.opts.deterministic:
+            keys = self._canonical_keys
+            order = {
+                name: keys.get(name)
+                or canonical_key(name if field.data_key is None else field.data_key)
+                for name, field in self.dump_fields.items()
+            }
+            self.dump_fields = self.dict_class(
+                (name, self.dump_fields[name]) for name in sorted(order, key=order.get)
+            )
+            self._dynamic_fields = [
+                (name if field.data_key is None else field.data_key, field)
+                for name, field in self.dump_fields.items()
+                if not isinstance(field, _SCALAR_FIELDS)
+            ]
+
+    @staticmethod
+    def _is_deterministic(field):
+        """Whether ``field`` is a nested schema which orders its own keys"""
+        return (
+            type(field) is m_fields.Nested
+            and getattr(field.schema.opts, 'deterministic', False)
+        )
+
     def _serialize(self, value, many, **kwargs):
         value = super()._serialize(value, many=many, **kwargs)
+        # With many=True each item has already been through here
+        if self.opts.deterministic and not many:
+            for key, field in self._dynamic_fields:
+                if key in value and not self._is_deterministic(field):
+                    value[key] = canonicalize(value[key])
         if self.opts.tag and not many:
             value = cbor2.CBORTag(self.opts.tag, value)
         return value
+
+
+class TagDispatcher:
+    """Load and dump top level CBOR items with a schema chosen by their tag(s)
+
+    Looking up the schema is a single dict access per tag, instead of trying
+    each schema in turn::
+
+        dispatcher = TagDispatcher({(61, 17): CWTMACSchema, 18: SignedDCCSchema})
+        claims = dispatcher.loads(token)
+
+    :param schemas: Mapping of tag ID (or tuple of tag IDs) to schema, see
+        ``fields.TagUnion``.
+    """
+
+    def __init__(self, schemas):
+        self._field = fields.TagUnion(schemas)
+
+    def load(self, data):
+        try:
+            return self._field.deserialize(data)
+        except ValidationError as error:
+            if error.messages == [self._field.error_messages['wrong_tag']]:
+                tag = data.tag if isinstance(data, cbor2.CBORTag) else None
+                raise ValidationError(f'unexpected tag: {tag}') from error
+            raise
+
+    def loads(self, data, **kwargs):
+        return self.load(cbor2.loads(data, **kwargs))
+
+    def dump(self, obj):
+        return self._field._serialize(obj, None, None)
+
+    def dumps(self, obj, **kwargs):
+        return cbor2.dumps(self.dump(obj), **kwargs)
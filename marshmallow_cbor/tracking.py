@@ -0,0 +1,353 @@
+from copy import deepcopy
+
+import cbor2
+
+# Tags whose meaning depends on other parts of the document (value sharing and
+# string references), so the encoding of a field can't be reused on its own.
+CONTEXT_TAGS = {25, 28, 29, 256}
+
+
+def encode_head(major, value):
+    """Encode the initial byte(s) of a CBOR data item"""
+    if value < 24:
+        return bytes(((major << 5) | value,))
+    for info, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if value < 1 << (size * 8):
+            return bytes(((major << 5) | info,)) + value.to_bytes(size, 'big')
+    raise ValueError(f'{value} is too large to encode')
+
+
+def _head(buf, pos):
+    initial = buf[pos]
+    major, info = initial >> 5, initial & 0x1F
+    pos += 1
+    if info < 24:
+        return major, info, pos
+    if info == 31:
+        return major, None, pos
+    if info > 27:
+        raise ValueError(f'invalid additional information {info}')
+    size = 1 << (info - 24)
+    return major, int.from_bytes(buf[pos:pos + size], 'big'), pos + size
+
+
+def _skip(buf, pos):
+    """Return the position just after the data item starting at ``pos``"""
+    major, arg, pos = _head(buf, pos)
+    if arg is None and major in (2, 3, 4, 5):
+        while buf[pos] != 0xFF:
+            pos = _skip(buf, pos)
+        return pos + 1
+    if major in (2, 3):
+        return pos + arg
+    if major in (4, 5):
+        for _ in range(arg * 2 if major == 5 else arg):
+            pos = _skip(buf, pos)
+        return pos
+    if major == 6:
+        if arg in CONTEXT_TAGS:
+            raise ValueError(f'cannot split items using tag {arg}')
+        return _skip(buf, pos)
+    return pos
+
+
+def _untag(buf):
+    """Return the tags of the item in ``buf``, the position of the tagged item and
+    its head"""
+    tags, start = (), 0
+    major, arg, pos = _head(buf, start)
+    while major == 6:
+        if arg in CONTEXT_TAGS:
+            raise ValueError(f'cannot split items using tag {arg}')
+        tags += (arg,)
+        start = pos
+        major, arg, pos = _head(buf, start)
+    return tags, start, major, arg, pos
+
+
+def _shape(buf):
+    """Tags and type of an encoded item, ignoring the size of its head"""
+    tags, start, major, arg, pos = _untag(buf)
+    if major == 7:
+        # Half, single and double precision floats are all the same type
+        info = buf[start] & 0x1F
+        return tags, major, 'float' if 25 <= info <= 27 else info
+    return tags, major
+
+
+def equivalent(encoded, value):
+    """Whether ``encoded`` can stand in for ``cbor2.dumps(value)``: it decodes to
+    ``value`` and only differs in the size of heads."""
+    try:
+        expected = cbor2.dumps(value)
+        if encoded == expected:
+            return True
+        return _shape(encoded) == _shape(expected) and cbor2.loads(encoded) == value
+    except (ValueError, IndexError, TypeError, cbor2.CBORError):
+        return False
+
+
+def view(data):
+    """Read only view of ``data`` which encodings can be sliced from"""
+    if not isinstance(data, bytes):
+        data = bytes(data)  # Don't keep views onto a buffer that could change
+    return memoryview(data)
+
+
+def map_entries(buf):
+    """Split the encoded map in ``buf`` into its entries.
+
+    :return: The map's tags and a list of ``(key, entry, value)`` for each entry,
+        with the decoded key and views of the encoded key and value and of the
+        value alone. ``None`` if ``buf`` isn't a definite length map which can be
+        split.
+    """
+    try:
+        tags, start, major, count, pos = _untag(buf)
+        if major != 5 or count is None:
+            return None
+        entries = []
+        for _ in range(count):
+            key_end = _skip(buf, pos)
+            end = _skip(buf, key_end)
+            entries.append((cbor2.loads(buf[pos:key_end]), buf[pos:end], buf[key_end:end]))
+            pos = end
+    except (ValueError, IndexError, TypeError, cbor2.CBORError):
+        return None
+    return tags, entries
+
+
+def array_items(buf):
+    """Split the encoded array in ``buf`` into views of its items, like
+    ``map_entries``"""
+    try:
+        tags, start, major, count, pos = _untag(buf)
+        if major != 4 or count is None:
+            return None
+        items = []
+        for _ in range(count):
+            end = _skip(buf, pos)
+            items.append(buf[pos:end])
+            pos = end
+    except (ValueError, IndexError, TypeError):
+        return None
+    return tags, items
+
+
+def byte_string(buf):
+    """View of the content of the definite length byte string in ``buf``, like
+    ``map_entries``"""
+    try:
+        tags, start, major, length, pos = _untag(buf)
+    except (ValueError, IndexError):
+        return None
+    if major != 2 or length is None:
+        return None
+    return tags, buf[pos:pos + length]
+
+
+def _modify(node):
+    """Mark ``node`` and the records containing it as no longer intact"""
+    while node is not None and not node._modified:
+        node._modified = True
+        node = node._parent
+
+
+def _adopt(parent, values):
+    for value in values:
+        if isinstance(value, (TrackedRecord, TrackedList)):
+            value._parent = parent
+
+
+class TrackedRecord(dict):
+    """Loaded record that remembers the encoding of each field it was loaded from
+
+    Assigning or deleting a key marks that field as changed, ``Schema.dumps``
+    then reuses the original encoding of every other field. Nested records (also
+    in ``Embedded`` and ``many`` fields) are loaded as ``TrackedRecord`` and
+    ``TrackedList`` themselves and tell the records containing them when they
+    change, so a change deep inside a record only re-encodes the records on the
+    path to it. Fields holding other maps or lists (``Dict``, ``List`` etc.) are
+    re-encoded on every dump.
+
+    :param source: Encoding of the whole record, if it can be reused.
+    """
+
+    def __init__(self, data, *, schema_class, encoded, source=None):
+        super().__init__(data)
+        self.schema_class = schema_class
+        self.encoded = encoded
+        self.source = source
+        self.changed = set()
+        self._parent = None
+        self._modified = False
+        _adopt(self, self.values())
+
+    def mark_changed(self, *keys):
+        """Re-encode these fields on the next dump even if they weren't assigned"""
+        self._change(keys)
+
+    def intact(self):
+        """Whether ``source`` is still the encoding of the whole record"""
+        return self.source is not None and not self._modified
+
+    def _change(self, keys):
+        self.changed.update(keys)
+        _modify(self)
+
+    def __setitem__(self, key, value):
+        self._change((key,))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._change((key,))
+        super().__delitem__(key)
+
+    def pop(self, key, *args):
+        self._change((key,))
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._change((key,))
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._change((key,))
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        updates = dict(*args, **kwargs)
+        self._change(updates)
+        super().update(updates)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        self._change(self)
+        super().clear()
+
+    def copy(self):
+        return self.__copy__()
+
+    def __copy__(self):
+        record = TrackedRecord(
+            {}, schema_class=self.schema_class, encoded=self.encoded, source=self.source
+        )
+        dict.update(record, self)
+        # Shared nested records only tell the original about their changes
+        record.changed = set(self.changed)
+        record._modified = self._modified
+        record._change(
+            key for key, value in self.items() if isinstance(value, (TrackedRecord, TrackedList))
+        )
+        return record
+
+    def __deepcopy__(self, memo):
+        record = TrackedRecord(
+            deepcopy(dict(self), memo),
+            schema_class=self.schema_class,
+            encoded=self.encoded,
+            source=self.source,
+        )
+        record.changed = set(self.changed)
+        record._modified = self._modified
+        return record
+
+    def __reduce__(self):
+        # Pickle as a plain dict, the encodings are views onto the input buffer
+        return dict, (dict(self),)
+
+
+class TrackedList(list):
+    """Loaded list of nested records which notices when items are added, removed
+    or replaced, see ``TrackedRecord``
+
+    :param source: Encoding of the whole list, if it can be reused.
+    """
+
+    def __init__(self, items, *, source=None):
+        super().__init__(items)
+        self.source = source
+        self.changed = False
+        self._parent = None
+        self._modified = False
+        _adopt(self, self)
+
+    def intact(self):
+        """Whether ``source`` is still the encoding of the whole list"""
+        return self.source is not None and not self._modified
+
+    def _change(self):
+        self.changed = True
+        _modify(self)
+
+    def __setitem__(self, key, value):
+        self._change()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._change()
+        super().__delitem__(key)
+
+    def append(self, item):
+        self._change()
+        super().append(item)
+
+    def extend(self, items):
+        self._change()
+        super().extend(items)
+
+    def insert(self, index, item):
+        self._change()
+        super().insert(index, item)
+
+    def pop(self, *args):
+        self._change()
+        return super().pop(*args)
+
+    def remove(self, item):
+        self._change()
+        super().remove(item)
+
+    def clear(self):
+        self._change()
+        super().clear()
+
+    def reverse(self):
+        self._change()
+        super().reverse()
+
+    def sort(self, *, key=None, reverse=False):
+        self._change()
+        super().sort(key=key, reverse=reverse)
+
+    def __iadd__(self, items):
+        self._change()
+        return super().__iadd__(items)
+
+    def __imul__(self, count):
+        self._change()
+        return super().__imul__(count)
+
+    def copy(self):
+        return self.__copy__()
+
+    def __copy__(self):
+        items = TrackedList([], source=self.source)
+        list.extend(items, self)
+        # Shared nested records only tell the original about their changes
+        items._change()
+        return items
+
+    def __deepcopy__(self, memo):
+        items = TrackedList(deepcopy(list(self), memo), source=self.source)
+        items.changed = self.changed
+        items._modified = self._modified
+        return items
+
+    def __reduce__(self):
+        return list, (list(self),)
@@ -1,6 +1,7 @@
 import datetime as dt
 import ipaddress
 from binascii import hexlify, unhexlify
+from copy import deepcopy
 
 import cbor2
 import pytest
@@ -51,6 +52,10 @@ class Utf8bytesSchema(Schema):
     data = fields.Bytes(load_as="utf8")
 
 
+class BytesSchema(Schema):
+    data = fields.Bytes()
+
+
 class SVSchema(Schema):
     data = fields.SimpleValue()
 
@@ -102,6 +107,7 @@ class SVSchema(Schema):
             {'data': '\u0001\u0002\u0003'},
             dumper({'data': b'\x01\x02\x03'}),
         ),
+        (BytesSchema(), {'data': b'\x01\x02\x03'}, dumper({'data': b'\x01\x02\x03'})),
         (
             SVSchema(),
             {'data': cbor2.CBORSimpleValue(9)},
@@ -128,6 +134,14 @@ def test_loads_one_way(schema, data, expected):
     assert schema.loads(unhexlify(data)) == expected
 
 
+def test_bytes_like_dump():
+    for data in (bytearray(b'\x01\x02\x03'), memoryview(b'\x01\x02\x03')):
+        assert BytesSchema().dumps({'data': data}) == cbor2.dumps({'data': b'\x01\x02\x03'})
+        assert HexSchema().dumps({'data': '010203'}) == cbor2.dumps({'data': bytes(data)})
+    assert Utf8bytesSchema().load({'data': memoryview(b'ab')}) == {'data': 'ab'}
+    assert HexSchema().load({'data': bytearray(b'\x01')}) == {'data': '01'}
+
+
 def test_invalid_string_display():
     with pytest.raises(ValueError):
 
@@ -140,3 +154,48 @@ def test_simple_error():
     with pytest.raises(ValidationError) as exc_info:
         schema.loads(cbor2.dumps({'data': 97}))
     assert exc_info.value.args[0] == {'data': ['Not a CBOR Simple Value']}
+
+
+class CachedSchema(Schema):
+    country = fields.String(cache=2, validate=lambda value: len(value) == 2)
+    day = fields.Date(cache=2)
+    url = fields.Url(cache=2)
+
+
+def test_field_cache():
+    schema = CachedSchema()
+    records = schema.load(
+        [
+            {'country': 'IE', 'day': '2021-05-06', 'url': 'https://example.com'},
+            {'country': 'FR', 'day': '2021-05-06', 'url': 'https://example.com'},
+            {'country': 'IE', 'day': '2021-05-07', 'url': 'https://example.com'},
+        ],
+        many=True,
+    )
+    assert records[0]['day'] is records[1]['day']
+    assert records[0]['day'] == dt.date(2021, 5, 6)
+    assert records[0]['country'] == records[2]['country'] == 'IE'
+    cache = schema.fields['url']._value_cache
+    assert cache.stats()['hits'] == 2
+    # The cache is shared by all instances of the schema
+    assert CachedSchema().fields['url']._value_cache is cache
+    # Other copies of a cache are independent
+    copied = deepcopy(cache)
+    assert copied is not cache
+    copied.clear()
+    assert len(cache) == 1
+    with pytest.raises(ValidationError):
+        schema.load({'country': 'IRL'})
+    with pytest.raises(ValidationError):
+        schema.load({'country': 'IRL'})
+    with pytest.raises(ValidationError):
+        schema.load({'country': None})
+
+
+def test_field_cache_types():
+    field = fields.String(cache=4)
+    assert field.deserialize('1') == '1'
+    with pytest.raises(ValidationError):
+        field.deserialize(1)
+    assert fields.Str is fields.String
+    assert fields.String().deserialize('a') == 'a'
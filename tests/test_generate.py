@@ -0,0 +1,109 @@
+import io
+
+import cbor2
+import pytest
+from marshmallow import validate
+
+from marshmallow_cbor import Schema, fields
+from marshmallow_cbor.generate import Generator
+
+
+class ItemSchema(Schema):
+    uid = fields.UUID()
+    code = fields.String(validate=validate.OneOf(['IE', 'FR', 'DE']))
+    count = fields.Integer(validate=validate.Range(1, 5))
+
+
+class KitchenSinkSchema(Schema):
+    ts = fields.Tagged(fields.Timestamp(), tag=1)
+    created = fields.AwareDateTime(data_key=1)
+    ip4 = fields.IPv4()
+    ip6 = fields.IPv6()
+    net = fields.IPv4Network()
+    simple = fields.SimpleValue()
+    signature = fields.Bytes(load_as='hex', validate=validate.Length(equal=64))
+    note = fields.Bytes(load_as='utf8')
+    url = fields.Url(schemes=('coap',))
+    email = fields.Email()
+    day = fields.Date()
+    ratio = fields.Float()
+    amount = fields.Decimal()
+    header = fields.Embedded(fields.Nested(ItemSchema))
+    items = fields.Nested(ItemSchema, many=True)
+    tags = fields.List(fields.String(validate=validate.Length(max=4)))
+    extra = fields.Dict(keys=fields.String(), values=fields.Integer())
+
+    class Meta:
+        tag = 4000
+
+
+def test_generate_valid():
+    schema = KitchenSinkSchema()
+    for encoded in Generator(schema, seed=42).encoded(50):
+        loaded = schema.loads(encoded)
+        assert len(loaded['signature']) == 64
+        assert all(item['code'] in {'IE', 'FR', 'DE'} for item in loaded['items'])
+        assert all(1 <= item['count'] <= 5 for item in loaded['items'])
+        assert loaded['url'].startswith('coap://')
+
+
+def test_generate_reproducible():
+    first = list(Generator(KitchenSinkSchema, seed=7).encoded(5))
+    second = list(Generator(KitchenSinkSchema, seed=7).encoded(5))
+    third = list(Generator(KitchenSinkSchema, seed=8).encoded(5))
+    assert first == second
+    assert first != third
+
+
+def test_write_sequence():
+    fp = io.BytesIO()
+    Generator(ItemSchema, seed=1).write_sequence(fp, 10)
+    fp.seek(0)
+    decoder = cbor2.CBORDecoder(fp)
+    items = [ItemSchema().load(decoder.decode()) for _ in range(10)]
+    assert fp.read() == b''
+    assert items == list(Generator(ItemSchema, seed=1).objects(10))
+
+
+class NodeSchema(Schema):
+    name = fields.String()
+    child = fields.Nested('NodeSchema')
+    children = fields.Nested('NodeSchema', many=True)
+
+
+def test_generate_max_depth():
+    def depth(node):
+        return 1 + max((depth(child) for child in node.get('children', ())), default=0)
+
+    schema = NodeSchema()
+    for obj in Generator(schema, seed=3, max_depth=2).objects(20):
+        assert schema.validate(obj) == {}
+        node = obj
+        for _ in range(2):
+            node = node['child']
+        assert 'child' not in node
+        assert depth(obj) <= 3
+
+
+class BoundsSchema(Schema):
+    odd = fields.Bytes(load_as='hex', validate=validate.Length(min=3, max=5))
+    low = fields.Integer(validate=validate.Range(0, 1, min_inclusive=False))
+    high = fields.Integer(validate=validate.Range(5, 6, max_inclusive=False))
+    unit = fields.Float(validate=validate.Range(0, 1, min_inclusive=False, max_inclusive=False))
+    cents = fields.Decimal(validate=validate.Range(0, 0.02, min_inclusive=False))
+
+
+def test_generate_bounds():
+    schema = BoundsSchema()
+    for encoded in Generator(schema, seed=5).encoded(50):
+        loaded = schema.loads(encoded)
+        assert len(loaded['odd']) == 4
+        assert (loaded['low'], loaded['high']) == (1, 5)
+
+
+def test_generate_impossible_length():
+    class OddSchema(Schema):
+        odd = fields.Bytes(load_as='hex', validate=validate.Length(equal=3))
+
+    with pytest.raises(ValueError):
+        Generator(OddSchema, seed=1).object()
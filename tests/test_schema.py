@@ -1,12 +1,23 @@
 import binascii
 import decimal
 import uuid
+from copy import deepcopy
+from datetime import datetime, timezone
 
+import cbor2
 import pytest
 
 from cbor2 import CBORTag
-from marshmallow import pre_load, post_dump, ValidationError
-from marshmallow_cbor import Schema
+from marshmallow import (
+    EXCLUDE,
+    INCLUDE,
+    pre_load,
+    post_dump,
+    validates,
+    validates_schema,
+    ValidationError,
+)
+from marshmallow_cbor import Schema, TagDispatcher
 from marshmallow_cbor.fields import (
     AwareDateTime,
     Decimal,
@@ -15,6 +26,13 @@ from marshmallow_cbor.fields import (
     Tagged,
     Embedded,
     Nested,
+    TagUnion,
+    List,
+    Raw,
+    String,
+    Integer,
+    Dict,
+    Timestamp,
 )
 
 
@@ -147,3 +165,503 @@ class IncorrectNestedTag(Schema):
 def test_exceptions(schema, source, expected):
     with pytest.raises(expected):
         schema.loads(binascii.unhexlify(source))
+
+
+class UnionSchema(Schema):
+    item = TagUnion({4096: TaggedSchema, (5990, 5991): EmbedSchema, None: UUIDSchema})
+
+
+@pytest.mark.parametrize(
+    'source, expected',
+    [
+        (
+            CBORTag(4096, {'a': True, 'b': decimal.Decimal(1)}),
+            {'a': True, 'b': decimal.Decimal(1)},
+        ),
+        (
+            CBORTag(5990, CBORTag(5991, {'a': False, 'b': decimal.Decimal(2)})),
+            {'a': False, 'b': decimal.Decimal(2)},
+        ),
+        (
+            {'uid': uuid.uuid5(uuid.NAMESPACE_DNS, 'example.com')},
+            {'uid': uuid.uuid5(uuid.NAMESPACE_DNS, 'example.com')},
+        ),
+    ],
+)
+def test_tag_union(source, expected):
+    schema = UnionSchema()
+    assert schema.load({'item': source}) == {'item': expected}
+    dispatcher = TagDispatcher(
+        {4096: TaggedSchema, (5990, 5991): EmbedSchema, None: UUIDSchema}
+    )
+    assert dispatcher.loads(cbor2.dumps(source)) == expected
+
+
+def test_tag_union_dump():
+    dispatcher = TagDispatcher({4096: TaggedSchema, (5990, 5991): EmbedSchema})
+    obj = {'a': True, 'b': decimal.Decimal(1)}
+    assert dispatcher.dump(CBORTag(4096, obj)) == CBORTag(4096, obj)
+    assert dispatcher.dump(CBORTag(5990, CBORTag(5991, obj))) == CBORTag(
+        5990, CBORTag(5991, obj)
+    )
+
+
+@pytest.mark.parametrize(
+    'source',
+    [
+        CBORTag(4097, {'a': True}),
+        CBORTag(5990, CBORTag(5992, {'a': True})),
+        {'a': True},
+    ],
+)
+def test_tag_union_exceptions(source):
+    with pytest.raises(ValidationError) as exc_info:
+        TagDispatcher({4096: TaggedSchema, (5990, 5991): EmbedSchema}).load(source)
+    assert exc_info.value.messages[0].startswith('unexpected tag')
+    with pytest.raises(ValidationError) as exc_info:
+        Schema.from_dict(
+            {'item': TagUnion({4096: TaggedSchema, (5990, 5991): EmbedSchema})}
+        )().load({'item': source})
+    assert exc_info.value.messages == {'item': ['unexpected tag']}
+
+
+class MeteredSchema(Schema):
+    a = Boolean()
+    b = Decimal(data_key=1)
+
+    class Meta:
+        metrics = True
+
+
+def test_metrics():
+    schema = MeteredSchema()
+    metrics = MeteredSchema.opts.metrics
+    metrics.reset()
+    encoded = schema.dumps({'a': True, 'b': decimal.Decimal(1)})
+    schema.loads(encoded)
+    schema.load([{'a': True}, {'a': False}, {'a': True}], many=True)
+    with pytest.raises(ValidationError):
+        schema.load([{'a': 'x', 1: 'y'}, {'a': 'x'}], many=True)
+
+    snapshot = metrics.snapshot()
+    assert snapshot['loads'] == 3
+    assert snapshot['dumps'] == 1
+    assert snapshot['records_in'] == 6
+    assert snapshot['bytes_in'] == snapshot['bytes_out'] == len(encoded)
+    assert snapshot['errors'] == 1
+    assert snapshot['field_errors'] == {'a': 2, 1: 1}
+    assert snapshot['batch_size']['count'] == 2
+    assert sum(snapshot['load_latency']['counts']) == 3
+    assert Schema.opts.metrics is None
+
+    metrics.reset()
+    assert metrics.snapshot()['loads'] == 0
+
+
+class CachedSchema(Schema):
+    a = Boolean()
+    b = Decimal()
+
+    class Meta:
+        load_cache = 2
+
+
+def test_load_cache():
+    schema = CachedSchema()
+    schema.load_cache.clear()
+    first = cbor2.dumps({'a': True, 'b': decimal.Decimal(1)})
+    second = cbor2.dumps({'a': False})
+    third = cbor2.dumps({'b': decimal.Decimal(3)})
+
+    loaded = schema.loads(first)
+    loaded['a'] = False
+    assert schema.loads(first) == {'a': True, 'b': decimal.Decimal(1)}
+    assert schema.loads(second) == {'a': False}
+    assert schema.loads(third) == {'b': decimal.Decimal(3)}
+    assert schema.load_cache.stats() == {
+        'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2
+    }
+    # many=True results are cached separately
+    assert schema.loads(cbor2.dumps([{'a': True}]), many=True) == [{'a': True}]
+    with pytest.raises(ValidationError):
+        schema.loads(cbor2.dumps({'a': 'x'}))
+    assert schema.loads(bytearray(second)) == {'a': False}
+    # The cache is shared by every instance, keyed by the loaded fields too
+    assert CachedSchema().load_cache is schema.load_cache
+    hits = schema.load_cache.stats()['hits']
+    assert CachedSchema().loads(third) == {'b': decimal.Decimal(3)}
+    assert schema.load_cache.stats()['hits'] == hits + 1
+    with pytest.raises(ValidationError):
+        CachedSchema(exclude=('b',)).loads(third)
+    assert CachedSchema(only=('b',)).loads(third) == {'b': decimal.Decimal(3)}
+    assert schema.load_cache.stats()['hits'] == hits + 1
+
+    schema.context['user'] = 'x'
+    before = schema.load_cache.stats()
+    assert schema.loads(first) == {'a': True, 'b': decimal.Decimal(1)}
+    assert schema.load_cache.stats() == before
+
+
+class CachedMeteredSchema(Schema):
+    a = Boolean()
+
+    class Meta:
+        load_cache = 2
+        metrics = True
+
+
+def test_load_cache_metrics():
+    schema = CachedMeteredSchema()
+    metrics = CachedMeteredSchema.opts.metrics
+    encoded = cbor2.dumps([{'a': True}, {'a': False}])
+    for _ in range(3):
+        assert schema.loads(encoded, many=True) == [{'a': True}, {'a': False}]
+    snapshot = metrics.snapshot()
+    assert schema.load_cache.stats()['hits'] == 2
+    assert snapshot['loads'] == 3
+    assert snapshot['records_in'] == 6
+    assert snapshot['bytes_in'] == 3 * len(encoded)
+    assert snapshot['load_latency']['count'] == 3
+
+
+def test_load_cache_ttl(monkeypatch):
+    from marshmallow_cbor import cache
+
+    now = [100.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    lru = cache.LRUCache(4, ttl=10)
+    lru.set('a', 1)
+    assert lru.get('a') == 1
+    now[0] += 11
+    assert lru.get('a') is None
+    assert lru.stats()['size'] == 0
+
+
+class LazySchema(Schema):
+    a = Boolean(required=True)
+    b = Decimal(data_key=1)
+    c = Boolean(missing=False)
+    nested = Nested(UUIDSchema)
+
+    class Meta:
+        tag = 4096
+
+
+def test_load_lazy():
+    uid = uuid.uuid5(uuid.NAMESPACE_DNS, 'example.com')
+    schema = LazySchema()
+    record = schema.loads_lazy(
+        cbor2.dumps(CBORTag(4096, {'a': True, 1: 'x', 'nested': {'uid': uid}}))
+    )
+    assert record['a'] is True
+    assert record['nested'] == {'uid': uid}
+    assert record['nested'] is record['nested']
+    assert record['c'] is False
+    with pytest.raises(ValidationError) as exc_info:
+        record['b']
+    assert exc_info.value.messages == {1: ['Not a valid number.']}
+    assert sorted(record) == ['a', 'b', 'c', 'nested']
+    with pytest.raises(ValidationError) as exc_info:
+        record.validate_all()
+    assert exc_info.value.messages == {1: ['Not a valid number.']}
+
+    record = schema.load_lazy({'a': True, 1: '2'})
+    assert record.validate_all() is record
+    assert dict(record) == {'a': True, 'b': decimal.Decimal(2), 'c': False}
+    with pytest.raises(ValidationError):
+        schema.load_lazy({'b': 1}).validate_all()
+    with pytest.raises(ValidationError):
+        schema.load_lazy(CBORTag(4097, {}))
+    with pytest.raises(ValidationError):
+        schema.load_lazy([])
+
+
+class ValidatedLazySchema(Schema):
+    a = Integer()
+    b = Integer()
+
+    @validates('a')
+    def check_a(self, value, **kwargs):
+        if value < 0:
+            raise ValidationError('negative')
+
+    @validates_schema
+    def check_order(self, data, **kwargs):
+        if data.get('a', 0) > data.get('b', 0):
+            raise ValidationError('a > b')
+
+
+def test_load_lazy_validate_all():
+    schema = ValidatedLazySchema()
+    with pytest.raises(ValidationError) as exc_info:
+        schema.load_lazy({'a': 1, 'b': 2, 'zzz': 3}).validate_all()
+    assert exc_info.value.messages == {'zzz': ['Unknown field.']}
+    with pytest.raises(ValidationError) as exc_info:
+        schema.load_lazy({'a': -1, 'b': 2}).validate_all()
+    assert exc_info.value.messages == {'a': ['negative']}
+    with pytest.raises(ValidationError) as exc_info:
+        schema.load_lazy({'a': 3, 'b': 2}).validate_all()
+    assert exc_info.value.messages == {'_schema': ['a > b']}
+
+    record = ValidatedLazySchema(unknown=INCLUDE).load_lazy({'a': 'x', 'zzz': 3})
+    assert 'a' in record and 'zzz' in record
+    assert 'b' not in record and 'nope' not in record
+    assert record.get('b', 5) == 5
+    assert record['zzz'] == 3
+    assert sorted(record, key=str) == ['a', 'zzz']
+    assert ValidatedLazySchema(unknown=EXCLUDE).load_lazy({'zzz': 3}).validate_all() == {}
+
+
+class DeterministicSchema(Schema):
+    name = String(data_key='aa')
+    code = String(data_key='b')
+    big = Integer(data_key=24)
+    neg = Integer(data_key=-1)
+    one = Integer(data_key=1)
+    extra = Dict()
+
+    class Meta:
+        deterministic = True
+        tag = 4096
+
+
+def test_deterministic():
+    schema = DeterministicSchema()
+    obj = {
+        'name': 'x',
+        'code': 'y',
+        'big': 3,
+        'neg': 2,
+        'one': 1,
+        'extra': {'zz': 1, 'a': {2: 'x', 1: 'y'}, 3: 0},
+    }
+    encoded = schema.dumps(obj)
+    decoded = cbor2.loads(encoded)
+    assert decoded.tag == 4096
+    assert list(decoded.value) == [1, 24, -1, 'b', 'aa', 'extra']
+    assert list(decoded.value['extra']) == [3, 'a', 'zz']
+    assert list(decoded.value['extra']['a']) == [1, 2]
+    assert schema.loads(encoded) == obj
+    assert list(DeterministicSchema(only=('neg', 'code', 'one')).dump(obj).value) == [
+        1, -1, 'b'
+    ]
+    assert DeterministicSchema().dumps([obj, obj], many=True) == cbor2.dumps(
+        [decoded, decoded]
+    )
+
+
+class UnorderedSchema(Schema):
+    z = Integer()
+    a = Integer()
+
+
+class WrappedMapsSchema(Schema):
+    items = List(Dict())
+    tagged = Tagged(Dict(), tag=4000)
+    embedded = Embedded(Dict())
+    raw = Raw()
+    nested = Nested(UnorderedSchema)
+    ordered = Nested(DeterministicSchema)
+
+    class Meta:
+        deterministic = True
+
+
+def test_deterministic_wrapped_maps():
+    unsorted = {'zz': 1, 'a': {2: 'x', 1: 'y'}}
+    obj = {
+        'items': [unsorted],
+        'tagged': unsorted,
+        'embedded': unsorted,
+        'raw': unsorted,
+        'nested': {'z': 1, 'a': 2},
+        'ordered': {'neg': 1, 'one': 2},
+    }
+    decoded = cbor2.loads(WrappedMapsSchema().dumps(obj))
+    expected = {'a': {1: 'y', 2: 'x'}, 'zz': 1}
+    for value in (
+        decoded['items'][0],
+        decoded['tagged'].value,
+        cbor2.loads(decoded['embedded']),
+        decoded['raw'],
+    ):
+        assert value == expected
+        assert list(value) == ['a', 'zz']
+        assert list(value['a']) == [1, 2]
+    assert list(decoded['nested']) == ['a', 'z']
+    assert list(decoded['ordered'].value) == [1, -1]
+    assert list(unsorted) == ['zz', 'a']
+
+
+class TrackedEmbedSchema(Schema):
+    b = Decimal()
+    a = Boolean()
+
+    class Meta:
+        ordered = True
+
+
+class TrackedSchema(Schema):
+    iss = String(data_key=1)
+    exp = Integer(data_key=4)
+    payload = Embedded(Nested(TrackedEmbedSchema), data_key=5)
+    extra = Dict(data_key='x')
+
+    class Meta:
+        track_changes = True
+        ordered = True
+        tag = 61
+
+
+def test_track_changes():
+    schema = TrackedSchema()
+    # exp is encoded with a needlessly long head, which survives a re-dump
+    source = binascii.unhexlify(
+        'd83da4'
+        '01' '6474657374'
+        '04' '1a00000005'
+        '05' '4aa26162c48200016161f5'
+        '6178' 'a1616101'
+    )
+    record = schema.loads(source)
+    assert record == {
+        'iss': 'test',
+        'exp': 5,
+        'payload': {'a': True, 'b': decimal.Decimal(1)},
+        'extra': {'a': 1},
+    }
+    assert schema.dumps(record) == source
+    record['exp'] = 6
+    encoded = schema.dumps(record)
+    assert encoded == source.replace(binascii.unhexlify('041a00000005'), b'\x04\x06')
+    assert schema.loads(encoded) == dict(record)
+
+    del record['iss']
+    record['payload']['a'] = False
+    record['extra']['a'] = 99
+    assert schema.dumps(record) == schema.dumps(dict(record))
+    assert schema.loads(schema.dumps(record)) == dict(record)
+
+    copied = deepcopy(schema.loads(source))
+    copied['extra'] = {}
+    assert schema.loads(schema.dumps(copied))['extra'] == {}
+
+
+class TrackedItemSchema(Schema):
+    name = String(data_key=1)
+    count = Integer(data_key=2)
+
+    class Meta:
+        ordered = True
+        metrics = True
+
+
+class TrackedTreeSchema(Schema):
+    iss = String(data_key=1)
+    item = Nested(TrackedItemSchema, data_key=2)
+    items = Nested(TrackedItemSchema, many=True, data_key=3)
+    payload = Embedded(Nested(TrackedItemSchema), data_key=4)
+
+    class Meta:
+        track_changes = True
+        ordered = True
+
+
+def test_track_changes_nested():
+    schema = TrackedTreeSchema()
+    metrics = TrackedItemSchema.opts.metrics
+    # item's count is encoded with a needlessly long head, which survives as long
+    # as item doesn't change
+    long_count = binascii.unhexlify('021a00000007')
+    source = cbor2.dumps(
+        {
+            1: 'x',
+            2: {1: 'a', 2: 7},
+            3: [{1: 'a', 2: 1}, {1: 'b', 2: 2}],
+            4: cbor2.dumps({1: 'p', 2: 3}),
+        }
+    ).replace(b'\x02\x07', long_count)
+    record = schema.loads(source)
+    metrics.reset()
+    assert schema.dumps(record) == source
+
+    record['iss'] = 'y'
+    record['items'][1]['count'] = 4
+    record['payload']['name'] = 'q'
+    encoded = schema.dumps(record)
+    # Nothing was dumped with the nested schema, only the changes re-encoded
+    assert metrics.snapshot()['dumps'] == 0
+    assert encoded == schema.dumps(dict(record)).replace(b'\x02\x07', long_count)
+    assert schema.loads(encoded) == dict(record)
+
+    record['items'].append({'name': 'c', 'count': 5})
+    record['item']['count'] = 8
+    encoded = schema.dumps(record)
+    assert encoded == schema.dumps(dict(record))
+    assert schema.loads(encoded)['items'][2] == {'name': 'c', 'count': 5}
+
+    # Nested records shared with a copy are re-encoded there too
+    copied = schema.loads(source).copy()
+    copied['item']['name'] = 'z'
+    assert schema.loads(schema.dumps(copied))['item'] == {'name': 'z', 'count': 7}
+
+
+class TypedTrackedSchema(Schema):
+    count = Integer(data_key=1)
+    ts = Timestamp(data_key=2)
+
+    class Meta:
+        track_changes = True
+        ordered = True
+
+
+def test_track_changes_other_types():
+    # Values encoded differently than the fields dump them are re-encoded
+    schema = TypedTrackedSchema()
+    ts = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    source = cbor2.dumps({1: 5.0, 2: ts}, datetime_as_timestamp=True)
+    record = schema.loads(source)
+    assert schema.dumps(record) == schema.dumps(dict(record))
+    decoded = cbor2.loads(schema.dumps(record))
+    assert type(decoded[1]) is int
+    assert decoded == {1: 5, 2: 1609459200}
+
+
+def test_track_changes_deterministic():
+    class DeterministicTrackedSchema(TrackedSchema):
+        class Meta:
+            track_changes = True
+            deterministic = True
+
+    schema = DeterministicTrackedSchema()
+    source = binascii.unhexlify('a3' '6178' 'a0' '04' '1a00000005' '01' '6474657374')
+    record = schema.loads(source)
+    assert schema.dumps(record) == binascii.unhexlify('a3' '01' '6474657374' '04' '05' '6178' 'a0')
+
+
+def test_track_changes_metrics():
+    class MeteredTrackedSchema(TrackedSchema):
+        class Meta:
+            track_changes = True
+            metrics = True
+
+    schema = MeteredTrackedSchema()
+    metrics = schema.opts.metrics
+    record = schema.loads(schema.dumps({'iss': 'test', 'exp': 5}))
+    metrics.reset()
+    encoded = schema.dumps(record)
+    snapshot = metrics.snapshot()
+    assert snapshot['dumps'] == 1
+    assert snapshot['records_out'] == 1
+    assert snapshot['bytes_out'] == len(encoded)
+    assert snapshot['dump_latency']['count'] == 1
+
+
+def test_track_changes_fallback():
+    # Schemas with hooks can't be spliced and load as before
+    class HookedSchema(TagWithinTagSchema):
+        class Meta:
+            track_changes = True
+
+    record = HookedSchema().loads(binascii.unhexlify(b'd91766d91767a26162f46161f5'))
+    assert type(record) is dict